@@ -0,0 +1,25 @@
+import os
+from numba.pycc import CC
+import kernels
+
+# ahead-of-time compiles the loop kernels of kernels.py into the crasp_native extension
+# kernels.py prefers it over numba's JIT, so runs pay no compilation warmup
+# (and plain CPython without numba installed still gets the compiled kernels)
+# usage: python build_native.py
+
+cc = CC('crasp_native')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export('parikh', 'void(i8[:], i8[:], i8[:], i8[:, :])')(kernels._parikh)
+cc.export('tarjan', 'i8[:](i8[:], i8[:])')(kernels._tarjan)
+cc.export('bfs_tree', 'UniTuple(i8[:], 2)(i8[:], i8[:], i8[:], i8)')(kernels._bfs_tree)
+
+# kernels.py only uses the extension if this matches the hash of its current kernel source
+SOURCE_HASH = kernels.kernel_source_hash()
+
+@cc.export('source_hash', 'i8()')
+def source_hash():
+    return SOURCE_HASH
+
+if __name__ == "__main__":
+    cc.compile()
@@ -4,13 +4,13 @@ from automata.fa.dfa import DFA
 from automata.fa.nfa import NFA
 import networkx as nx
 from sympy import Matrix
-import matplotlib.pyplot as plt
 import decider as d
 import argparse
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("regex", type=str)
+    parser.add_argument("--draw", action="store_true", help="show the dfa graph with matplotlib")
     args = parser.parse_args()
 
     regex_str = ''.join(args.regex)
@@ -19,8 +19,9 @@ if __name__ == "__main__":
     my_dfa = DFA.from_nfa(nfa, minify=True)
 
     generate_dfa_diagram(my_dfa, filename='drawings/my_dfa', output_format='svg', auto_open=False)
-    G = d.automata_to_graph(my_dfa)
-    plt.show()
+    if args.draw:
+        G = d.automata_to_graph(my_dfa)
+        d.show_graph(G)
 
     membership = d.decide_CRASP_membership(my_dfa)
     print(f"CRASP membership: {membership}")
@@ -1,25 +1,75 @@
+import math
+from collections import deque
+from fractions import Fraction
+from functools import lru_cache
 import dfa
 from dfa import generate_dfa_diagram
 from automata.fa.dfa import DFA
 from automata.fa.nfa import NFA
 import networkx as nx
-from sympy import Matrix
-import matplotlib.pyplot as plt
+import numpy as np
+from kernels import (bfs_tree, csr, get_cycle_basis_edges, get_ordered_alphabet, group_edges,
+                     loop_equations, separated, strongly_connected_components)
 
-def nullspaces_equal(A, B):
-    ns_A = A.nullspace()
-    ns_B = B.nullspace()
+def rref(rows):
+    # Gauss-Jordan elimination over the rationals
+    # rows is a list of lists of numbers
+    # returns the reduced row echelon form (as Fractions) and the pivot columns
+    M = [[Fraction(x) for x in row] for row in rows]
+    n_cols = len(M[0]) if M else 0
+    pivots = []
+    r = 0
+    for c in range(n_cols):
+        pivot_row = next((i for i in range(r, len(M)) if M[i][c] != 0), None)
+        if pivot_row is None:
+            continue
+        M[r], M[pivot_row] = M[pivot_row], M[r]
+        p = M[r][c]
+        M[r] = [x / p for x in M[r]]
+        for i in range(len(M)):
+            if i != r and M[i][c] != 0:
+                f = M[i][c]
+                M[i] = [a - f * b for a, b in zip(M[i], M[r])]
+        pivots.append(c)
+        r += 1
+        if r == len(M):
+            break
+    return M, pivots
+
+@lru_cache(maxsize=1024)
+def _nullspace(shape, data):
+    # cached on the raw bytes of the basis, so an unchanged basis is not reduced twice
+    rows = np.frombuffer(data, dtype=np.int64).reshape(shape).tolist()
+    reduced, pivots = rref(rows)
+    n_cols = shape[1]
+    free_vars = [c for c in range(n_cols) if c not in pivots]
+    ns = []
+    # same construction as sympy's Matrix.nullspace (the rref is unique, so are the vectors)
+    for free_var in free_vars:
+        vec = [Fraction(0)] * n_cols
+        vec[free_var] = Fraction(1)
+        for piv_row, piv_col in enumerate(pivots):
+            vec[piv_col] -= reduced[piv_row][free_var]
+        ns.append(tuple(vec))
+    return tuple(ns)
+
+def nullspace(basis):
+    # rational nullspace of an integer matrix (the loop equations)
+    # returns a tuple of vectors, each a tuple of Fractions
+    basis = np.ascontiguousarray(basis, dtype=np.int64)
+    return _nullspace(basis.shape, basis.tobytes())
 
+def nullspaces_equal(ns_A, ns_B):
     if len(ns_A) != len(ns_B):
         return False
     if len(ns_A) == 0:
         return True
+    if len(ns_A[0]) != len(ns_B[0]):
+        return False
 
-    NA = Matrix.hstack(*ns_A)
-    NB = Matrix.hstack(*ns_B)
-
-    r = NA.rank()
-    return Matrix.hstack(NA, NB).rank() == r
+    # the spans agree iff stacking them does not increase the rank
+    r = len(rref(ns_A)[1])
+    return len(rref(list(ns_A) + list(ns_B))[1]) == r
 
 def automata_to_graph(my_dfa):
     # converts a dfa into a networkx graph
@@ -27,18 +77,22 @@ def automata_to_graph(my_dfa):
     states = my_dfa.states
     transitions = my_dfa.transitions
     G = nx.MultiDiGraph()
-    state_list = list(states)
-    state_mapping = {}
-    for i in range(len(state_list)):
-        state_mapping[state_list[i]] = i
+    state_mapping = {s: i for i, s in enumerate(states)}
     for q in states:
         for sym in transitions[q].keys():
-            G.add_edge(state_mapping[q], state_mapping[transitions[q][sym]], key=sym, label=sym)
+            u, v = state_mapping[q], state_mapping[transitions[q][sym]]
+            G.add_edge(u, v, key=sym, label=sym)
     return G
 
+def _lazy_plt():
+    # pyplot is slow to import and only needed for drawing
+    import matplotlib.pyplot as plt
+    return plt
+
 def show_graph(G):
     # show the graph
     # does not disambiguate multi-edges
+    plt = _lazy_plt()
     pos = nx.spring_layout(G)
     nx.draw_networkx(G, pos, with_labels=True, node_color='lightblue', arrows=True)
     edge_labels = {}
@@ -48,177 +102,161 @@ def show_graph(G):
     plt.show()
 
 
-def get_path_edges(G, path):
-    # path is a list of nodes in a multigraph
-    # recursively computes all paths through the multigraph through the nodes in order
-    # returns a list of lists of edges (n1, n2, symbol)
-    if len(path) < 2:
-        return []
-    edges = []
-    first = path[0]
-    rest = path[1:]
-    successors = list(G.successors(first))
-    for succ in successors:
-        if succ == rest[0]:
-            for sym in G[first][succ]:
-                label = G[first][succ][sym]['label']
-                if isinstance(label, Matrix):
-                    label = tuple(label)
-                if len(rest) == 1:
-                    edges.append([(first, succ, label)])
-                else:
-                    sub_paths = get_path_edges(G, rest)
-                    for sp in sub_paths:
-                        edges.append([(first, succ, label)] + sp)
-    return edges
-
-def get_simple_cycles_edges(G):
-    # computes all simple cycles in G
-    # returns a list of lists of edges (n1, n2, symbol)
-    cycles = []
-    for cycle in nx.simple_cycles(G):
-        edges = get_path_edges(G, cycle + [cycle[0]])
-        cycles.extend(edges)
-    return cycles
-
-def loop_equations(ordered_alphabet, cycles):
-    # to maintain a balanced morphism, all loops must sum to 0
-    # each loop defines a linear equation based on its Parikh image
-    # we will then find the nullspace of this set of linear equations
-    # this gives the basis of all balanced morphisms
-    basis = []
-    for cycle in cycles:
-        vec = [0]*len(ordered_alphabet)
-        for _,_,sym in cycle:
-            index = ordered_alphabet.index(sym)
-            vec[index] += 1
-        basis.append(vec)
-    return basis
+def automata_to_arrays(my_dfa):
+    # converts a dfa into flat edge arrays (one edge per transition)
+    # states are numbered as in automata_to_graph and symbols by their sorted order
+    # returns (n, src, dst, sym, symbols), where symbols[sym[e]] is the symbol of edge e
+    states = my_dfa.states
+    transitions = my_dfa.transitions
+    state_mapping = {s: i for i, s in enumerate(states)}
+    symbols = sorted(my_dfa.input_symbols)
+    sym_mapping = {sym: i for i, sym in enumerate(symbols)}
+    edges = [(state_mapping[q], state_mapping[t], sym_mapping[sym])
+             for q in states for sym, t in transitions[q].items()]
+    src = np.fromiter((u for u, _, _ in edges), dtype=np.int32, count=len(edges))
+    dst = np.fromiter((v for _, v, _ in edges), dtype=np.int32, count=len(edges))
+    sym = np.fromiter((a for _, _, a in edges), dtype=np.int32, count=len(edges))
+    return len(states), src, dst, sym, symbols
 
-def relabel(G, cycles, morphism):
-    # morphism is a dict for relabling symbols
+def relabel(n, src, dst, sym, morphism):
+    # morphism maps each symbol id to an integer vector (a row of an int64 array)
     # the labels will be vectors
     # choose an arbitrary start node
     # for each edge n1 -> n2 with label sym
     # pick a path from start to n1
     # the new label is the sum of morphism[sym]
     # and the sum of morphism[label] for edges in the path
+    # the new label also remembers the old label of the first n1 -> n2 edge
+    # returns the relabeled (src, dst, sym); edges whose new labels coincide are merged
 
-    graph_copy = G.copy()
-    start_node = list(graph_copy.nodes())[0]
-    for u, v, data in G.edges(data=True):
-        path = nx.shortest_path(G, source=start_node, target=u)
-        path_edges = get_path_edges(G, path)
-        label = data['label']
-        vec = morphism[label]
-        if path_edges:
-            # if there are paths, sum up the labels under the morphism
-            # take the first (they all must end up the same)
-            path_edges = path_edges[0]
-            for e in path_edges:
-                vec += morphism[e[2]]
-        # update the label of the u -> v edge in the copy of the graph
-        graph_copy[u][v][label]['label'] = tuple(vec)
-    G.clear()
-    for u, v, data in graph_copy.edges(data=True):
-        key = list(graph_copy[u][v].keys())[0]
-        new_label = tuple([data['label'],key])
-        G.add_edge(u, v, label=new_label, key=new_label)
+    # a single BFS from the start node gives every node its path sum
+    # (any path will do, they all must end up the same)
+    indptr, order = csr(n + 1, src)
+    visit, parent_edge = bfs_tree(indptr, dst[order].astype(np.int64), order.astype(np.int64), 0)
+    offset = np.zeros((n + 1, morphism.shape[1]), dtype=np.int64)
+    for x in visit[1:]:
+        e = parent_edge[x]
+        offset[x] = offset[src[e]] + morphism[sym[e]]
+    vecs = morphism[sym] + offset[src]
 
-def separated(G):
-    # separated nodes are those where the set of outgoing edge labels are different
-    # check that all pairs of nodes are separated
-    # do not consider the 'garbage' node
-    nodes = [n for n in G.nodes() if n != 'garbage']
-    for i in range(len(nodes)):
-        for j in range(i + 1, len(nodes)):
-            n1 = nodes[i]
-            n2 = nodes[j]
-            labels_n1 = set()
-            for _, v, data in G.out_edges(n1, data=True):
-                labels_n1.add(data['label'])
-            labels_n2 = set()
-            for _, v, data in G.out_edges(n2, data=True):
-                labels_n2.add(data['label'])
-            if labels_n1 == labels_n2:
-                return False
-    return True
+    # the first edge between the same pair of nodes
+    pair = src.astype(np.int64) * (n + 1) + dst
+    _, first, inverse = np.unique(pair, return_index=True, return_inverse=True)
+    history = sym[first[inverse]]
+
+    # canonicalize the new labels (vector, history) to fresh ids
+    labels, new_sym = np.unique(np.column_stack((vecs, history)), axis=0, return_inverse=True)
+    new_sym = new_sym.reshape(-1).astype(np.int32)
 
-def get_ordered_alphabet(G):
-    labels = []
-    for u in sorted(G.nodes(), key=str):
-        for u, v, data in G.out_edges(u, data=True):
-            label = data['label']
-            if label not in labels:
-                labels.append(label)
-    return labels
+    # merge parallel edges that now carry the same label (keeping the edge order)
+    triple = pair * len(labels) + new_sym
+    _, keep = np.unique(triple, return_index=True)
+    keep.sort()
+    return src[keep], dst[keep], new_sym[keep]
 
-def attack_scc(G):
+def attack_scc(names, src, dst, sym):
     # attack an SCC (to decide membership in C-RASP)
-    temp_G = G.copy()
-    prev_basis = None
+    # the SCC has nodes 0..n-1 (named names[i] in the dfa graph) plus a garbage node n
+    n = len(names)
+    prev_ns = None
     # the algorithm converges once the null spaces don't change
     while True:
         # find all balanced morphisms using the nullspace of the loop equations
-        ordered_alphabet = get_ordered_alphabet(temp_G)
-        cycles = get_simple_cycles_edges(temp_G)
-        basis = Matrix(loop_equations(ordered_alphabet, cycles))
+        ordered_alphabet = get_ordered_alphabet(names, src, sym)
+        cycles = get_cycle_basis_edges(n, src, dst, sym)
+        basis = loop_equations(ordered_alphabet, cycles)
         # print(f"Current basis: {basis}")
-        if prev_basis is not None and nullspaces_equal(basis, prev_basis):
+        # no loops at all gives no equations (an empty nullspace)
+        ns = nullspace(basis) if len(basis) else ()
+        if prev_ns is not None and nullspaces_equal(ns, prev_ns):
             # converged
             break
-        if basis.nullspace() == []:
+        if len(ns) == 0:
             # no more nontrivial balanced morphisms
             break
         else:
-            prev_basis = basis
+            prev_ns = ns
             # relabel the graph using the morphism defined by the nullspace basis
-            morphism = {}
-            for i in range(len(ordered_alphabet)):
-                vec = []
-                for nb in basis.nullspace():
-                    vec.append(nb[i])
-                morphism[ordered_alphabet[i]] = Matrix(vec)
+            # (row i of the nullspace matrix transposed is the image of ordered_alphabet[i])
+            # each basis vector is scaled to integers, which does not change which labels are equal
+            scaled = []
+            for nb in ns:
+                m = math.lcm(*(y.denominator for y in nb))
+                scaled.append([int(x * m) for x in nb])
+            morphism = np.zeros((sym.max() + 1, len(ns)), dtype=np.int64)
+            morphism[ordered_alphabet] = np.array(scaled, dtype=np.int64).T
             # apply the morphism to relabel the graph
-
-            relabel(temp_G, cycles, morphism)
+            src, dst, sym = relabel(n, src, dst, sym, morphism)
+            if separated(n, src, sym):
+                # the labels already separate the nodes, no need to wait for convergence
+                return True
     # after convergence, return whether the morphism separates the nodes
-    return separated(temp_G)
+    return separated(n, src, sym)
+
+def dfa_signature(my_dfa):
+    # canonical (hashable) form of a dfa, used to cache decisions
+    # states are renumbered in BFS order from the initial state (symbols in sorted order)
+    # so isomorphic dfas, e.g. two minimized dfas of the same language, get the same signature
+    transitions = my_dfa.transitions
+    order = {my_dfa.initial_state: 0}
+    queue = deque([my_dfa.initial_state])
+    rows = []
+    while queue:
+        q = queue.popleft()
+        row = []
+        for sym in sorted(transitions[q]):
+            target = transitions[q][sym]
+            if target not in order:
+                order[target] = len(order)
+                queue.append(target)
+            row.append((sym, order[target]))
+        rows.append(tuple(row))
+    finals = tuple(sorted(order[q] for q in my_dfa.final_states if q in order))
+    return (tuple(sorted(my_dfa.input_symbols)), tuple(rows), finals)
 
 def decide_CRASP_membership(my_dfa):
     # decide membership in C-RASP by iterating over the SCCs in the dfa
     # the entire dfa is in C-RASP iff every SCC is in C-RASP
-    G = automata_to_graph(my_dfa)
-    sccs = nx.strongly_connected_components(G)
+    n, src, dst, sym, symbols = automata_to_arrays(my_dfa)
+    sccs = strongly_connected_components(n, src, dst)
     for component in sccs:
-        # duplicate component
-        temp_G = G.subgraph(component).copy()
-        garbage_node = 'garbage'
-        temp_G.add_node(garbage_node)
-        # print(f"Attacking SCC with nodes: {temp_G.nodes()} and edges: {[(u, v, data['label']) for u, v, data in temp_G.edges(data=True)]}")
-        # make sure that every node has an outgoing edge for every symbol in the alphabet (add a garbage node for missing edges)
+        if len(component) == 1:
+            # a single node is trivially separated (with or without self loops),
+            # so there is no need to attack it
+            continue
+        # duplicate component, renumbering its nodes 0..k-1
+        names = component.astype(np.int32)
+        k = len(names)
+        local = np.full(n, -1, dtype=np.int32)
+        local[names] = np.arange(k, dtype=np.int32)
+        inner = (local[src] >= 0) & (local[dst] >= 0)
+        scc_src, scc_dst, scc_sym = local[src[inner]], local[dst[inner]], sym[inner]
+        # print(f"Attacking SCC with nodes: {names} and edges: {list(zip(scc_src, scc_dst, scc_sym))}")
+        # make sure that every node has an outgoing edge for every symbol in the alphabet (add a garbage node k for missing edges)
         # but don't add self loops to the garbage node
-        alphabet = set()
-        for _, _, data in temp_G.edges(data=True):
-            label = data['label']
-            label = tuple(label) if isinstance(label, Matrix) else label
-            alphabet.add(label)
-        for node in temp_G.nodes():
-            for sym in alphabet:
-                # Do not add self loops to the garbage node
-                if node == garbage_node:
-                    continue
-                if not any((node, _, data) for _, _, data in temp_G.out_edges(node, data=True) if data['label'] == sym):
-                    temp_G.add_edge(node, garbage_node, label=sym, key=sym)
-        # show the graph of the SCC being attacked
-        result = attack_scc(temp_G)
+        alphabet = np.unique(scc_sym)
+        present = np.zeros((k, len(symbols)), dtype=bool)
+        present[scc_src, scc_sym] = True
+        missing_nodes, missing_syms = np.nonzero(~present[:, alphabet])
+        scc_src = np.concatenate((scc_src, missing_nodes.astype(np.int32)))
+        scc_dst = np.concatenate((scc_dst, np.full(len(missing_nodes), k, dtype=np.int32)))
+        scc_sym = np.concatenate((scc_sym, alphabet[missing_syms]))
+        order = group_edges(k + 1, scc_src, scc_dst)
+        result = attack_scc(names, scc_src[order], scc_dst[order], scc_sym[order])
         if not result:
             return False
     return True
 
+@lru_cache(maxsize=256)
+def build_dfa(regex_str):
+    # minimized dfa of a regex (in NFA.from_regex syntax, i.e. | for alternation)
+    # memoized (bounded, exact repeats are rare) since sampled regexes can repeat
+    # the dfa is immutable, so sharing it is safe
+    nfa = NFA.from_regex(regex_str)
+    return DFA.from_nfa(nfa, minify=True)
+
 def decide_CRASP_membership_from_regex(regex_str):
-    nfa = NFA.from_regex(regex_str.replace('+', '|'))
-    my_dfa = DFA.from_nfa(nfa, minify=True)
+    my_dfa = build_dfa(regex_str.replace('+', '|'))
     return decide_CRASP_membership(my_dfa)
 
 if __name__ == "__main__":
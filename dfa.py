@@ -1,5 +1,6 @@
+import io
 import subprocess
-from typing import Optional, Dict, Set
+from typing import Optional, Dict, Set, TextIO
 from automata.fa.dfa import DFA
 
 def generate_dfa_diagram(
@@ -25,16 +26,15 @@ def generate_dfa_diagram(
         Path to the generated file
     """
 
-    dot_string = _build_dot_string(
-        dfa,
-        transition_labels=transition_labels,
-        rankdir=rankdir
-    )
-
     # Write DOT file
     dot_file = f'{filename}.dot'
     with open(dot_file, 'w') as f:
-        f.write(dot_string)
+        _write_dot(
+            dfa,
+            f,
+            transition_labels=transition_labels,
+            rankdir=rankdir
+        )
 
     # Generate output file
     output_file = f'{filename}.{output_format}'
@@ -48,40 +48,48 @@ def generate_dfa_diagram(
     return output_file
 
 
-def _build_dot_string(
+def _write_dot(
     dfa,
+    out: TextIO,
     transition_labels: Optional[Dict] = None,
     rankdir: str = 'LR'
-) -> str:
-    """Build the DOT format string for the DFA."""
+) -> None:
+    """Write the DOT format lines for the DFA to out as they are generated."""
 
-    dot_lines = [
-        'digraph DFA {',
-        f'rankdir={rankdir};',
-        'node [shape=circle];'
-    ]
+    write = out.write
+
+    write('digraph DFA {\n')
+    write(f'rankdir={rankdir};\n')
+    write('node [shape=circle];\n')
 
     # Mark final states
+    final_states = dfa.final_states
     for state in dfa.states:
-        if state in dfa.final_states:
-            shape = 'doublecircle'
-        else:
-            shape = 'circle'
-
-        dot_lines.append(f'{state} [shape={shape}];')
+        shape = 'doublecircle' if state in final_states else 'circle'
+        write(f'{state} [shape={shape}];\n')
 
     # Add transitions
     for from_state, transitions in dfa.transitions.items():
         for symbol, to_state in transitions.items():
-            dot_lines.append(f'{from_state} -> {to_state} [label="{symbol}"];')
+            write(f'{from_state} -> {to_state} [label="{symbol}"];\n')
 
     # Mark initial state
-    dot_lines.append('_start [shape=point, label=""];')
-    dot_lines.append(f'_start -> {dfa.initial_state};')
+    write('_start [shape=point, label=""];\n')
+    write(f'_start -> {dfa.initial_state};\n')
+
+    write('}')
 
-    dot_lines.append('}')
 
-    return '\n'.join(dot_lines)
+def _build_dot_string(
+    dfa,
+    transition_labels: Optional[Dict] = None,
+    rankdir: str = 'LR'
+) -> str:
+    """Build the DOT format string for the DFA."""
+
+    buffer = io.StringIO()
+    _write_dot(dfa, buffer, transition_labels=transition_labels, rankdir=rankdir)
+    return buffer.getvalue()
 
 my_dfa = DFA(
     states={'q0', 'q1', 'q2', 'q3', 'q4', 'q5', 'q6'},
@@ -8,13 +8,17 @@ from automata.fa.dfa import DFA
 from automata.fa.nfa import NFA
 import networkx as nx
 from sympy import Matrix
-import matplotlib.pyplot as plt
 import decider as d
+import kernels
 import argparse
 import random
 from typing import Dict, List
 import csv
 import os
+import shelve
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pysemigroup.ring import hash_matrix
 import sys
 
@@ -42,6 +46,15 @@ def _patched_automaton(self):
 pysemigroup.RegularLanguage.automaton = _patched_automaton
 
 
+def decider_version():
+    # hash of the decider sources; cached decisions are only valid for the decider that made them
+    h = hashlib.sha256()
+    for module in (d, kernels):
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
 class CFG:
     """Context-Free Grammar sampler with customizable rule probabilities."""
 
@@ -67,39 +80,41 @@ class CFG:
         if symbol is None:
             symbol = self.start_symbol
 
-        if symbol not in self.rules:
-            return symbol
-
-        if max_depth <= 0:
-            # When depth exhausted, force terminal-only productions
-            terminal_prods = [p for p in self.rules[symbol]
-                              if all(s not in self.rules for s in p)]
-            if terminal_prods:
-                production = random.choice(terminal_prods)
+        # expand with an explicit stack of (symbol, remaining depth)
+        # productions are pushed reversed so symbols pop left to right
+        rules = self.rules
+        rule_probs = self.rule_probs
+        stack = [(symbol, max_depth)]
+        result = []
+        while stack:
+            sym, depth = stack.pop()
+            prods = rules.get(sym)
+            if prods is None:
+                result.append(sym)
+                continue
+
+            if depth <= 0:
+                # When depth exhausted, force terminal-only productions
+                terminal_prods = [p for p in prods
+                                  if all(s not in rules for s in p)]
+                if terminal_prods:
+                    production = random.choice(terminal_prods)
+                else:
+                    # If no pure terminal production, pick shortest
+                    production = min(prods, key=len)
+                # Expand remaining symbols with depth=0 (will force terminals)
+                child_depth = 0
             else:
-                # If no pure terminal production, pick shortest
-                production = min(self.rules[symbol], key=len)
-            # Expand remaining symbols with depth=0 (will force terminals)
-            result = []
-            for sym in production:
-                if sym not in self.rules:
-                    result.append(sym)
+                if sym in rule_probs:
+                    probs = rule_probs[sym]
+                    idx = random.choices(range(len(prods)), weights=probs)[0]
+                    production = prods[idx]
                 else:
-                    result.append(self.sample(sym, 0))
-            return ''.join(result)
-
-        prods = self.rules[symbol]
-        if symbol in self.rule_probs:
-            probs = self.rule_probs[symbol]
-            idx = random.choices(range(len(prods)), weights=probs)[0]
-            production = prods[idx]
-        else:
-            production = random.choice(prods)
+                    production = random.choice(prods)
+                child_depth = depth - 1
 
-        result = []
-        for sym in production:
-            expanded = self.sample(sym, max_depth - 1)
-            result.append(expanded)
+            for child in reversed(production):
+                stack.append((child, child_depth))
 
         return ''.join(result)
 
@@ -136,6 +151,12 @@ regex_rules = {
     ]
 }
 
+@lru_cache(maxsize=256)
+def syntactic_monoid(regex_str, alphabet):
+    # memoized (bounded, exact repeats are rare) since sampled regexes can repeat
+    language = pysemigroup.RegularLanguage.from_easy_regex(regex_str, alphabet)
+    return language.syntactic_monoid()
+
 def check_R(semigroup):
     for x in semigroup.elements():
         R = semigroup.R_class_of_element(x)
@@ -160,7 +181,83 @@ def check_R_infinity(semigroup):
             break
     return not two_idempotents_in_the_same_R_class
 
+# letters produced by regex_rules
+alphabet = 'abc'
+
+# decider cache of a worker process (a snapshot of the shelve, see _init_worker)
+_decider_cache: Dict[str, bool] = {}
+
+def _init_worker(decider_cache):
+    global _decider_cache
+    _decider_cache = decider_cache
+
+def classify(row):
+    # classify one (index, regex) row into a bin (runs in a worker process)
+    # returns (bin_name, out_row, cache_entry, dfa_cache_hit) where out_row is the
+    # row to write to that bin, cache_entry is a new (key, decision) for the decider cache
+    # and dfa_cache_hit tells whether the dfa came out of the d.build_dfa cache
+    # bin_name is one of 'r', 'crasp', 'r_infty_not_crasp', 'not_r_infty', 'errors'
+    cache_entry = None
+    dfa_cache_hit = False
+    try:
+        idx = row[0]
+        regex_str = row[1]
+
+        # get the syntactic monoid of the language
+        semigroup = syntactic_monoid(regex_str, alphabet)
+
+        # check R membership first (since R is a subset of C-RASP)
+        try:
+            r_membership = check_R(semigroup)
+        except Exception as e:
+            return 'errors', [idx, f"R check error: {e}"], cache_entry, dfa_cache_hit
+
+        # check C-RASP membership
+        try:
+            # build NFA/DFA
+            # note that we use + for alternation in the regex rules, but the NFA.from_regex expects |, so we replace it here
+            hits = d.build_dfa.cache_info().hits
+            my_dfa = d.build_dfa(regex_str.replace('+', '|'))
+            dfa_cache_hit = d.build_dfa.cache_info().hits > hits
+            # the CFG often generates equivalent regexes, whose minimized dfas coincide
+            # so the decider is memoized on the canonical dfa signature
+            key = repr(d.dfa_signature(my_dfa))
+            if key in _decider_cache:
+                crasp_membership = _decider_cache[key]
+            else:
+                crasp_membership = d.decide_CRASP_membership(my_dfa)
+                _decider_cache[key] = crasp_membership
+                cache_entry = (key, crasp_membership)
+        except Exception as e:
+            # If decider fails, record error and skip
+            return 'errors', [idx, f"C-RASP decider error: {e}"], cache_entry, dfa_cache_hit
+
+        # check R_infinity
+        try:
+            r_infty = check_R_infinity(semigroup)
+        except Exception as e:
+            return 'errors', [idx, f"R_infinity check error: {e}"], cache_entry, dfa_cache_hit
+
+        # binning
+        if r_membership:
+            bin_name = 'r'
+        elif crasp_membership:
+            bin_name = 'crasp'
+        elif r_infty:
+            bin_name = 'r_infty_not_crasp'
+        else:
+            bin_name = 'not_r_infty'
+        return bin_name, [idx, regex_str, r_membership, crasp_membership, r_infty], cache_entry, dfa_cache_hit
+
+    except Exception as e:
+        # catch any unexpected parsing/IO error for the row
+        return 'errors', row + [f"unexpected error: {e}"], cache_entry, dfa_cache_hit
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    args = parser.parse_args()
 
     # generate
     n = 1000
@@ -213,11 +310,15 @@ if __name__ == "__main__":
     not_r_infty_path = 'results/not_r_infinity.txt'
     all_results_path = 'results/all_results.txt'
     errors_path = 'results/classify_errors.txt'
+    # decider results persist across runs, keyed by minimized dfa
+    # (and cleared whenever decider.py or kernels.py change)
+    decider_cache_path = 'data/decider_cache.db'
 
 
     counts = {'r': 0, 'crasp': 0, 'r_infty_not_crasp': 0, 'not_r_infty': 0, 'errors': 0}
 
-    with open(errors_path, 'w', newline='') as err_file, \
+    with shelve.open(decider_cache_path) as decider_cache, \
+         open(errors_path, 'w', newline='') as err_file, \
          open(input_file_path, 'r', newline='') as csvfile, \
          open(r_path, 'w', newline='') as r_file, \
          open(crasp_path, 'w', newline='') as crasp_file, \
@@ -225,6 +326,12 @@ if __name__ == "__main__":
          open(all_results_path, 'w', newline='') as all_file, \
          open(not_r_infty_path, 'w', newline='') as notr_file:
 
+        # drop decisions made by an older version of the decider
+        version = decider_version()
+        if decider_cache.get('__version__') != version:
+            decider_cache.clear()
+            decider_cache['__version__'] = version
+
         reader = csv.reader(csvfile)
         r_writer = csv.writer(r_file)
         crasp_writer = csv.writer(crasp_file)
@@ -242,65 +349,31 @@ if __name__ == "__main__":
         err_writer.writerow(["index", "regex", "error"])
 
 
-        for row in reader:
-            try:
-                idx = row[0]
-                regex_str = row[1]
-
-                language = pysemigroup.RegularLanguage.from_easy_regex(regex_str, alphabet)
-
-                # get the syntactic monoid of the language
-                semigroup = language.syntactic_monoid()
-
-                # check R membership first (since R is a subset of C-RASP)
-                try:
-                    r_membership = check_R(semigroup)
-                except Exception as e:
-                    err_writer.writerow([idx, f"R check error: {e}"])
-                    counts['errors'] += 1
-                    continue
-
-                # check C-RASP membership
-                try:
-                    # build NFA/DFA
-                    # note that we use + for alternation in the regex rules, but the NFA.from_regex expects |, so we replace it here
-                    nfa = NFA.from_regex(regex_str.replace('+', '|'))
-                    my_dfa = DFA.from_nfa(nfa, minify=True)
-                    crasp_membership = d.decide_CRASP_membership(my_dfa)
-                except Exception as e:
-                    # If decider fails, record error and skip
-                    err_writer.writerow([idx, f"C-RASP decider error: {e}"])
-                    counts['errors'] += 1
-                    continue
-
-                # check R_infinity
-                try:
-                    r_infty = check_R_infinity(semigroup)
-                except Exception as e:
-                    err_writer.writerow([idx, f"R_infinity check error: {e}"])
-                    counts['errors'] += 1
-                    continue
-
-                # binning
-                if r_membership:
-                    r_writer.writerow([idx, regex_str, True, crasp_membership, r_infty])
-                    counts['r'] += 1
-                elif crasp_membership:
-                    crasp_writer.writerow([idx, regex_str, r_membership, True, r_infty])
-                    counts['crasp'] += 1
-                elif r_infty:
-                    rinf_writer.writerow([idx, regex_str, r_membership, crasp_membership, True])
-                    counts['r_infty_not_crasp'] += 1
-                else:
-                    notr_writer.writerow([idx, regex_str, r_membership, crasp_membership, r_infty])
-                    counts['not_r_infty'] += 1
-
-                all_writer.writerow([idx, regex_str, r_membership, crasp_membership, r_infty])
-
-            except Exception as e:
-                # catch any unexpected parsing/IO error for the row
-                err_writer.writerow(row + [f"unexpected error: {e}"])
-                counts['errors'] += 1
+        bin_writers = {
+            'r': r_writer,
+            'crasp': crasp_writer,
+            'r_infty_not_crasp': rinf_writer,
+            'not_r_infty': notr_writer,
+            'errors': err_writer,
+        }
+
+        # rows are independent, so classify them in parallel
+        # results come back in input order and are written from this process
+        # workers get a snapshot of the decider cache and report new entries back
+        dfa_cache_hits = 0
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(dict(decider_cache),)) as ex:
+            for bin_name, out_row, cache_entry, dfa_cache_hit in ex.map(classify, reader, chunksize=16):
+                dfa_cache_hits += dfa_cache_hit
+                if cache_entry is not None:
+                    decider_cache[cache_entry[0]] = cache_entry[1]
+                bin_writers[bin_name].writerow(out_row)
+                counts[bin_name] += 1
+                if bin_name != 'errors':
+                    all_writer.writerow(out_row)
+
+    # the dfa cache lives in each worker, so this only counts repeats within a worker
+    print(f"DFA cache hits: {dfa_cache_hits} of {n} regexes")
 
     # write a small summary
     summary_path = 'results/classify_summary.txt'
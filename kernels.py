@@ -0,0 +1,254 @@
+# array kernels of the decider
+# graphs are flat edge arrays (src, dst, sym) over nodes 0..n-1, with CSR adjacency from csr()
+# this module only depends on numpy (no networkx / sympy / automata globals)
+#
+# the loop kernels (_parikh, _tarjan, _bfs_tree) are written in the numba-compatible subset and
+# are picked up, in order of preference, from
+#  - the crasp_native extension compiled ahead of time by build_native.py (no JIT warmup)
+#  - numba's njit, if numba is installed
+#  - plain Python / numpy otherwise
+import hashlib
+import inspect
+import warnings
+import numpy as np
+
+
+def _parikh(cycle_syms, cycle_signs, offsets, out):
+    # out[c, sym] accumulates the signed count of sym on cycle c
+    for c in range(offsets.size - 1):
+        for i in range(offsets[c], offsets[c + 1]):
+            out[c, cycle_syms[i]] += cycle_signs[i]
+
+def _parikh_add_at(cycle_syms, cycle_signs, offsets, out):
+    # numpy version of _parikh (for when nothing compiles it)
+    rows = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))
+    np.add.at(out, (rows, cycle_syms), cycle_signs)
+
+def _tarjan(indptr, adj):
+    # iterative Tarjan over a CSR adjacency (the successors of v are adj[indptr[v]:indptr[v+1]])
+    # returns comp, where comp[v] is the id of the strongly connected component of v
+    n = indptr.size - 1
+    index = np.full(n, -1, dtype=np.int64)
+    low = np.zeros(n, dtype=np.int64)
+    on_stack = np.zeros(n, dtype=np.bool_)
+    stack = np.empty(n, dtype=np.int64)
+    comp = np.full(n, -1, dtype=np.int64)
+    # explicit call stack of (node, next edge to look at)
+    call_node = np.empty(n, dtype=np.int64)
+    call_edge = np.empty(n, dtype=np.int64)
+    sp = 0
+    counter = 0
+    n_comp = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = counter
+        low[root] = counter
+        counter += 1
+        stack[sp] = root
+        sp += 1
+        on_stack[root] = True
+        call_node[0] = root
+        call_edge[0] = indptr[root]
+        cp = 1
+        while cp > 0:
+            v = call_node[cp - 1]
+            i = call_edge[cp - 1]
+            if i < indptr[v + 1]:
+                call_edge[cp - 1] = i + 1
+                w = adj[i]
+                if index[w] == -1:
+                    index[w] = counter
+                    low[w] = counter
+                    counter += 1
+                    stack[sp] = w
+                    sp += 1
+                    on_stack[w] = True
+                    call_node[cp] = w
+                    call_edge[cp] = indptr[w]
+                    cp += 1
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                cp -= 1
+                if low[v] == index[v]:
+                    # v is the root of a component, pop it off the stack
+                    while True:
+                        sp -= 1
+                        w = stack[sp]
+                        on_stack[w] = False
+                        comp[w] = n_comp
+                        if w == v:
+                            break
+                    n_comp += 1
+                if cp > 0:
+                    u = call_node[cp - 1]
+                    low[u] = min(low[u], low[v])
+    return comp
+
+
+def _bfs_tree(indptr, nbr, nbr_edge, start):
+    # BFS over a CSR adjacency, where nbr[i] is a neighbour reached through the edge nbr_edge[i]
+    # returns (visit, parent_edge): the reached nodes in visiting order, and for every
+    # node the edge it was reached by (-1 for the start node and unreached nodes)
+    n = indptr.size - 1
+    parent_edge = np.full(n, -1, dtype=np.int64)
+    seen = np.zeros(n, dtype=np.bool_)
+    visit = np.empty(n, dtype=np.int64)
+    visit[0] = start
+    seen[start] = True
+    head = 0
+    tail = 1
+    while head < tail:
+        x = visit[head]
+        head += 1
+        for i in range(indptr[x], indptr[x + 1]):
+            y = nbr[i]
+            if not seen[y]:
+                seen[y] = True
+                parent_edge[y] = nbr_edge[i]
+                visit[tail] = y
+                tail += 1
+    return visit[:tail], parent_edge
+
+def kernel_source_hash():
+    # hash of the loop kernels' source (fits an int64)
+    # build_native.py records it in crasp_native, so a stale build is detected
+    h = hashlib.sha256()
+    for kernel in (_parikh, _tarjan, _bfs_tree):
+        h.update(inspect.getsource(kernel).encode())
+    return int(h.hexdigest()[:15], 16)
+
+def _load_native():
+    # the crasp_native extension, if it is built from the current kernels (else None)
+    try:
+        import crasp_native
+    except ImportError:
+        return None
+    if not hasattr(crasp_native, 'source_hash') or crasp_native.source_hash() != kernel_source_hash():
+        warnings.warn("crasp_native was built from other kernel sources, ignoring it "
+                      "(rebuild it with python build_native.py)")
+        return None
+    return crasp_native
+
+native = _load_native()
+if native is not None:
+    parikh = native.parikh
+    tarjan = native.tarjan
+    bfs_tree = native.bfs_tree
+else:
+    try:
+        from numba import njit
+        parikh = njit(cache=True)(_parikh)
+        tarjan = njit(cache=True)(_tarjan)
+        bfs_tree = njit(cache=True)(_bfs_tree)
+    except ImportError:
+        parikh = _parikh_add_at
+        tarjan = _tarjan
+        bfs_tree = _bfs_tree
+
+
+def csr(n, src):
+    # CSR adjacency of the edge arrays
+    # the out-edges of node u are the edge indices order[indptr[u]:indptr[u+1]]
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, order
+
+def group_edges(n, src, dst):
+    # edge order of a networkx multigraph: by source, then by target in order of
+    # first appearance, parallel edges in insertion order
+    # returns the permutation putting the edges in that order
+    pair = src.astype(np.int64) * n + dst
+    _, first, inverse = np.unique(pair, return_index=True, return_inverse=True)
+    return np.lexsort((first[inverse], src))
+
+def strongly_connected_components(n, src, dst):
+    # strongly connected components of the graph given by edge arrays
+    # returns a list of arrays, each holding the (sorted) nodes of one SCC
+    indptr, order = csr(n, src)
+    comp = tarjan(indptr, dst[order].astype(np.int64))
+    nodes = np.argsort(comp, kind='stable')
+    return np.split(nodes, np.flatnonzero(np.diff(comp[nodes])) + 1)
+
+def get_cycle_basis_edges(n, src, dst, sym):
+    # computes a basis of the cycle space of the SCC on nodes 0..n-1
+    # (the loop equations only need a basis, not every simple cycle:
+    #  in a strongly connected graph the directed cycles span the cycle space)
+    # edges into the garbage node n are on no cycle and are ignored
+    # grow a spanning tree ignoring edge directions; every non-tree
+    # edge u -> v closes a fundamental cycle with the tree path v ~> u
+    # returns flat arrays (cycle_syms, cycle_signs, offsets): cycle c consists of the
+    # edges offsets[c]:offsets[c+1], signs are -1 for tree edges traversed against their direction
+    inner = np.flatnonzero(dst < n)
+    # undirected incidence: every edge is listed at both of its endpoints
+    ends = np.concatenate((src[inner], dst[inner]))
+    others = np.concatenate((dst[inner], src[inner])).astype(np.int64)
+    edge_ids = np.concatenate((inner, inner)).astype(np.int64)
+    indptr, order = csr(n, ends)
+    _, parent_edge = bfs_tree(indptr, others[order], edge_ids[order], 0)
+    is_tree = np.zeros(len(src), dtype=bool)
+    is_tree[parent_edge[parent_edge >= 0]] = True
+
+    def to_root(x, sign, edges, signs):
+        # signed edges of the tree path from x up to the root
+        while parent_edge[x] >= 0:
+            e = parent_edge[x]
+            edges.append(e)
+            if src[e] == x:
+                signs.append(sign)
+                x = dst[e]
+            else:
+                signs.append(-sign)
+                x = src[e]
+
+    edges, signs, offsets = [], [], [0]
+    for e in inner[~is_tree[inner]]:
+        # u -> v, then v ~> root ~> u (shared tree edges cancel out)
+        edges.append(e)
+        signs.append(1)
+        to_root(dst[e], 1, edges, signs)
+        to_root(src[e], -1, edges, signs)
+        offsets.append(len(edges))
+    cycle_syms = sym[np.array(edges, dtype=np.int64)]
+    return cycle_syms, np.array(signs, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+def loop_equations(ordered_alphabet, cycles):
+    # to maintain a balanced morphism, all loops must sum to 0
+    # each loop defines a linear equation based on its Parikh image
+    # we will then find the nullspace of this set of linear equations
+    # this gives the basis of all balanced morphisms
+    # returns an integer matrix with one (signed) row per cycle
+    cycle_syms, cycle_signs, offsets = cycles
+    idx = np.zeros(ordered_alphabet.max() + 1, dtype=np.int64)
+    idx[ordered_alphabet] = np.arange(len(ordered_alphabet), dtype=np.int64)
+    basis = np.zeros((len(offsets) - 1, len(ordered_alphabet)), dtype=np.int64)
+    parikh(idx[cycle_syms], cycle_signs, offsets, basis)
+    return basis
+
+def separated(n, src, sym):
+    # separated nodes are those where the set of outgoing edge labels are different
+    # check that all pairs of nodes are separated
+    # do not consider the garbage node n
+    inner = src < n
+    n_labels = int(sym.max()) + 1 if len(sym) else 1
+    # sorted unique (node, label) pairs, then split into the label set of each node
+    pairs = np.unique(src[inner].astype(np.int64) * n_labels + sym[inner])
+    owners = pairs // n_labels
+    out_labels = []
+    if len(pairs):
+        groups = np.split(pairs % n_labels, np.flatnonzero(np.diff(owners)) + 1)
+        out_labels = [labels.tobytes() for labels in groups]
+    # nodes without outgoing edges all have the same (empty) label set
+    out_labels += [b''] * (n - len(out_labels))
+    return len(set(out_labels)) == len(out_labels)
+
+def get_ordered_alphabet(names, src, sym):
+    # symbol ids in order of first appearance, visiting nodes sorted by (the str of) their name
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[sorted(range(len(names)), key=lambda i: str(names[i]))] = np.arange(len(names))
+    inner = src < len(names)
+    labels = sym[inner][np.argsort(rank[src[inner]], kind='stable')]
+    _, first = np.unique(labels, return_index=True)
+    return labels[np.sort(first)]